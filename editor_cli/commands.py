@@ -12,63 +12,97 @@ class Command(Protocol):
         ...
 
 
-@dataclass
+@dataclass(slots=True)
 class TextInsertCommand:
     buffer: list[str]
     line: int
     col: int
     text: str
-    # snapshot for undo
-    _prev_line: Optional[str] = None
 
     def execute(self) -> None:
         idx = self.line - 1
         pos = self.col - 1
         current = self.buffer[idx]
-        self._prev_line = current
         self.buffer[idx] = current[:pos] + self.text + current[pos:]
 
     def undo(self) -> None:
-        if self._prev_line is not None:
-            self.buffer[self.line - 1] = self._prev_line
-
-
-@dataclass
+        # 只需去掉插入的片段，无需保存整行快照
+        idx = self.line - 1
+        pos = self.col - 1
+        current = self.buffer[idx]
+        self.buffer[idx] = current[:pos] + current[pos + len(self.text) :]
+
+    def try_merge(self, other: object) -> bool:
+        # 紧接在本次插入末尾的插入可以合并为同一条撤销记录
+        if (
+            isinstance(other, TextInsertCommand)
+            and other.buffer is self.buffer
+            and other.line == self.line
+            and other.col == self.col + len(self.text)
+        ):
+            self.text += other.text
+            return True
+        return False
+
+
+@dataclass(slots=True)
 class TextDeleteCommand:
     buffer: list[str]
     line: int
     col: int
     length: int
-    _prev_line: Optional[str] = None
+    # 被删除的片段，用于撤销
+    _removed: Optional[str] = None
 
     def execute(self) -> None:
         idx = self.line - 1
         pos = self.col - 1
         current = self.buffer[idx]
-        self._prev_line = current
+        self._removed = current[pos : pos + self.length]
         self.buffer[idx] = current[:pos] + current[pos + self.length :]
 
     def undo(self) -> None:
-        if self._prev_line is not None:
-            self.buffer[self.line - 1] = self._prev_line
+        if self._removed is not None:
+            idx = self.line - 1
+            pos = self.col - 1
+            current = self.buffer[idx]
+            self.buffer[idx] = current[:pos] + self._removed + current[pos:]
 
 
-@dataclass
+@dataclass(slots=True)
 class TextReplaceCommand:
     buffer: list[str]
     line: int
     col: int
     length: int
     text: str
-    _prev_line: Optional[str] = None
+    # 被替换掉的片段，用于撤销
+    _removed: Optional[str] = None
 
     def execute(self) -> None:
         idx = self.line - 1
         pos = self.col - 1
         current = self.buffer[idx]
-        self._prev_line = current
+        self._removed = current[pos : pos + self.length]
         self.buffer[idx] = current[:pos] + self.text + current[pos + self.length :]
 
     def undo(self) -> None:
-        if self._prev_line is not None:
-            self.buffer[self.line - 1] = self._prev_line
+        if self._removed is not None:
+            idx = self.line - 1
+            pos = self.col - 1
+            current = self.buffer[idx]
+            self.buffer[idx] = current[:pos] + self._removed + current[pos + len(self.text) :]
+
+
+@dataclass(slots=True)
+class CompositeCommand:
+    # 一组命令作为一条撤销记录：按顺序执行，逆序撤销
+    commands: list[Command]
+
+    def execute(self) -> None:
+        for cmd in self.commands:
+            cmd.execute()
+
+    def undo(self) -> None:
+        for cmd in reversed(self.commands):
+            cmd.undo()
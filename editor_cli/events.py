@@ -1,24 +1,91 @@
-from dataclasses import dataclass
-from typing import Callable, Dict, List, Any
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Any, Sequence, Set, Tuple
 
 
 class EventBus:
     def __init__(self) -> None:
-        self._subscribers: Dict[str, List[Callable[[Any], None]]] = {}
+        # 以 dict 作为有序集合：保持订阅顺序，删除为 O(1)
+        self._subscribers: Dict[str, Dict[Callable[[Any], None], None]] = {}
+        # emit 使用的处理器快照，订阅变化时失效
+        self._snapshots: Dict[str, Tuple[Callable[[Any], None], ...]] = {}
+        # 曾有处理器抛出异常的事件，之后逐个处理器捕获异常
+        self._fragile_events: Set[str] = set()
+        # 批量处理器：一次接收一组 payload
+        self._batch: Dict[str, Dict[Callable[[Sequence[Any]], None], None]] = {}
 
     def subscribe(self, event: str, handler: Callable[[Any], None]) -> None:
-        self._subscribers.setdefault(event, []).append(handler)
+        self._subscribers.setdefault(event, {})[handler] = None
+        self._snapshots.pop(event, None)
+
+    def subscribe_many(self, event: str, handler: Callable[[Sequence[Any]], None]) -> None:
+        """订阅批量处理器：emit 时收到单元素元组，emit_many 时一次收到整批 payload。"""
+        self._batch.setdefault(event, {})[handler] = None
 
     def unsubscribe(self, event: str, handler: Callable[[Any], None]) -> None:
-        if event in self._subscribers:
-            self._subscribers[event] = [h for h in self._subscribers[event] if h != handler]
+        handlers = self._subscribers.get(event)
+        if handlers is not None and handlers.pop(handler, False) is None:
+            self._snapshots.pop(event, None)
+        batch = self._batch.get(event)
+        if batch is not None:
+            batch.pop(handler, None)
+
+    def has_listeners(self, event: str) -> bool:
+        """该事件是否有任何处理器（普通或批量）。"""
+        return bool(self._subscribers.get(event) or self._batch.get(event))
 
     def emit(self, event: str, payload: Any) -> None:
-        for handler in self._subscribers.get(event, []):
+        # 处理器按事件名分表存放，分发时只查本事件的表；无人订阅时直接返回
+        if not self.has_listeners(event):
+            return
+        batch = self._batch.get(event)
+        if batch:
+            self._emit_batch(batch, (payload,))
+        self._emit_single(event, payload)
+
+    def emit_many(self, event: str, payloads: Sequence[Any]) -> None:
+        """一次分发一组 payload：批量处理器只调用一次，其余处理器逐个调用。"""
+        if not payloads:
+            return
+        batch = self._batch.get(event)
+        if batch:
+            self._emit_batch(batch, payloads)
+        for payload in payloads:
+            self._emit_single(event, payload)
+
+    @staticmethod
+    def _emit_batch(batch: Dict[Callable[[Sequence[Any]], None], None], payloads: Sequence[Any]) -> None:
+        # 每批只调用一次，逐个保护的开销可以忽略；一个处理器失败不影响其他处理器
+        for handler in tuple(batch):
+            try:
+                handler(payloads)
+            except Exception:
+                pass
+
+    def _emit_single(self, event: str, payload: Any) -> None:
+        handlers = self._snapshots.get(event)
+        if handlers is None:
+            handlers = self._snapshots[event] = tuple(self._subscribers.get(event, ()))
+        if not handlers:
+            return
+        if event in self._fragile_events:
+            self._emit_guarded(handlers, payload)
+            return
+        it = iter(handlers)
+        try:
+            for handler in it:
+                handler(payload)
+        except Exception:
+            # 日志监听失败不影响主流程；该事件之后改为逐个保护
+            self._fragile_events.add(event)
+            self._emit_guarded(it, payload)
+
+    @staticmethod
+    def _emit_guarded(handlers: Iterable[Callable[[Any], None]], payload: Any) -> None:
+        for handler in handlers:
             try:
                 handler(payload)
             except Exception:
-                # 日志监听失败不影响主流程
                 pass
 
 
@@ -27,3 +94,5 @@ class CommandEvent:
     file: str | None
     command: str
     args: str
+    # 命令执行时刻；事件可能缓存后才分发，日志时间戳以此为准
+    at: float = field(default_factory=time.time)
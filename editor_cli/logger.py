@@ -1,59 +1,271 @@
 from __future__ import annotations
 
-from datetime import datetime
+import atexit
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Set
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 from .events import EventBus, CommandEvent
 
 
-def _ts() -> str:
-    return datetime.now().strftime("%Y%m%d %H:%M:%S")
+# 后台线程被唤醒后等待多久再写盘（秒），让紧随其后的事件并入同一批；
+# 队列深度超过 FLUSH_DEPTH 时不再等待
+FLUSH_INTERVAL = 0.01
+FLUSH_DEPTH = 64
+# 追加写打开日志：O_APPEND 保证每次写入原子地追加到文件末尾
+_OPEN_FLAGS = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_CLOEXEC", 0)
+# writev 单次可提交的缓冲区个数上限（Linux 的 IOV_MAX）
+_IOV_MAX = 1024
+
+
+# 同一秒内的时间戳只格式化一次：[秒, 编码后的时间戳]
+_TS_CACHE: List = [-1, b""]
+# 命令名 -> 编码后的字节（命令名只有十几个）
+_CMD_BYTES_CACHE: Dict[str, bytes] = {}
+
+
+def _ts_bytes(at: float) -> bytes:
+    sec = int(at)
+    if sec != _TS_CACHE[0]:
+        _TS_CACHE[1] = time.strftime("%Y%m%d %H:%M:%S", time.localtime(sec)).encode("utf-8")
+        _TS_CACHE[0] = sec
+    return _TS_CACHE[1]
+
+
+def _cmd_b(name: str) -> bytes:
+    b = _CMD_BYTES_CACHE.get(name)
+    if b is None:
+        b = _CMD_BYTES_CACHE[name] = name.encode("utf-8", "replace")
+    return b
+
+
+def _log_path(file: Path) -> Path:
+    return file.parent / f".{file.name}.log"
+
+
+def _write_all(fd: int, chunks: List[bytes]) -> None:
+    """写出 chunks 中的全部内容，处理部分写入；已写出的部分从列表中移除，
+    出错时列表中只剩尚未写出的内容。"""
+    while chunks:
+        batch = chunks[:_IOV_MAX]
+        n = os.writev(fd, batch) if hasattr(os, "writev") else os.write(fd, b"".join(batch))
+        done = 0
+        while done < len(batch) and n >= len(batch[done]):
+            n -= len(batch[done])
+            done += 1
+        del chunks[:done]
+        if n:
+            chunks[0] = chunks[0][n:]
+
+
+def _iter_log(log_path: Path) -> Iterator[str]:
+    try:
+        f = log_path.open("r", encoding="utf-8", newline="\n")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
+# 所有存活的 FileLogger，进程退出时统一写出并关闭（只注册一个 atexit 钩子）
+_LOGGERS: "weakref.WeakSet[FileLogger]" = weakref.WeakSet()
+
+
+def _close_all_loggers() -> None:
+    for logger in list(_LOGGERS):
+        try:
+            logger.close_all()
+        except OSError:
+            pass
+
+
+atexit.register(_close_all_loggers)
+
+
+@dataclass(eq=False)
+class _LogState:
+    """单个文件的日志状态：日志路径、会话期间保持打开的 fd、待写入的行。"""
+
+    log_path: Path
+    fd: Optional[int] = None
+    pending: Deque[bytes] = field(default_factory=deque)
 
 
 class FileLogger:
-    """按文件记录命令日志。使用观察者监听命令事件。"""
+    """按文件记录命令日志。使用观察者监听命令事件。
+
+    事件处理只把格式化好的行放入内存队列，由后台线程批量写入（每个文件一次 writev）。
+    后台线程在首次入队时启动，队列为空时阻塞等待，close_all 时停止。
+    """
 
     def __init__(self, event_bus: EventBus) -> None:
         self.event_bus = event_bus
-        self.enabled_files: Set[Path] = set()
+        self.enabled_files: Dict[Path, _LogState] = {}
         self.session_started: Set[Path] = set()
-        self.event_bus.subscribe("command", self._on_command)
+        # 有待写入内容的文件
+        self._dirty: List[_LogState] = []
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        # 保证多次 flush 之间的写盘顺序，并保护 fd 的打开与关闭
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # 当前的后台写盘线程；置为 None 即通知它退出
+        self._flusher: Optional[threading.Thread] = None
+        _LOGGERS.add(self)
+        self.event_bus.subscribe_many("command", self._on_command_many)
 
     def set_enabled(self, file: Path, enabled: bool) -> None:
         if enabled:
-            self.enabled_files.add(file)
-        else:
-            self.enabled_files.discard(file)
+            if file not in self.enabled_files:
+                self.enabled_files[file] = _LogState(log_path=_log_path(file))
+        elif file in self.enabled_files:
+            try:
+                self.close(file)
+            finally:
+                del self.enabled_files[file]
 
     def is_enabled(self, file: Path) -> bool:
         return file in self.enabled_files
 
     def show(self, file: Path) -> str:
-        log_path = file.parent / f".{file.name}.log"
+        self.flush()
+        log_path = _log_path(file)
         if not log_path.exists():
             return ""
         return log_path.read_text(encoding="utf-8")
 
-    def _ensure_session(self, file: Path) -> None:
-        if file in self.session_started:
-            return
-        log_path = file.parent / f".{file.name}.log"
-        log_path.parent.mkdir(parents=True, exist_ok=True)
-        with log_path.open("a", encoding="utf-8") as f:
-            f.write(f"session start at {_ts()}\n")
-        self.session_started.add(file)
-
-    def _on_command(self, evt: CommandEvent) -> None:
-        if not evt.file:
-            return
-        file = Path(evt.file)
-        if file not in self.enabled_files:
+    def iter_lines(self, file: Path) -> Iterator[str]:
+        """逐行读取日志（不含换行符），不把整个日志读入内存。"""
+        self.flush()
+        return _iter_log(_log_path(file))
+
+    def close(self, file: Path) -> None:
+        """写出该文件的待写日志并关闭其 fd；再次记录时会重新打开。"""
+        state = self.enabled_files.get(file)
+        if state is None:
             return
-        self._ensure_session(file)
-        log_path = file.parent / f".{file.name}.log"
-        with log_path.open("a", encoding="utf-8") as f:
+        try:
+            self.flush()
+        finally:
+            with self._io_lock:
+                if state.fd is not None:
+                    os.close(state.fd)
+                    state.fd = None
+
+    def close_all(self) -> None:
+        """停止后台线程，写出全部待写日志并关闭所有 fd（退出时调用）。"""
+        flusher = self._flusher
+        if flusher is not None:
+            with self._lock:
+                self._flusher = None
+            self._wakeup.set()
+            if flusher is not threading.current_thread():
+                flusher.join()
+        try:
+            self.flush()
+        finally:
+            with self._io_lock:
+                for state in self.enabled_files.values():
+                    if state.fd is not None:
+                        os.close(state.fd)
+                        state.fd = None
+
+    def flush(self) -> None:
+        """把队列中的日志全部写盘。写入失败的行放回队列，之后重试，并抛出第一个错误。"""
+        with self._io_lock:
+            with self._lock:
+                if not self._pending_count:
+                    return
+                batches = [(state, list(state.pending)) for state in self._dirty]
+                for state in self._dirty:
+                    state.pending.clear()
+                self._dirty = []
+                self._pending_count = 0
+            error: Optional[OSError] = None
+            failed: List[Tuple[_LogState, List[bytes]]] = []
+            for state, chunks in batches:
+                try:
+                    if state.fd is None:
+                        state.log_path.parent.mkdir(parents=True, exist_ok=True)
+                        state.fd = os.open(str(state.log_path), _OPEN_FLAGS, 0o644)
+                    _write_all(state.fd, chunks)
+                except OSError as e:
+                    # 关掉可能已失效的 fd，重试时重新打开
+                    if state.fd is not None:
+                        try:
+                            os.close(state.fd)
+                        except OSError:
+                            pass
+                        state.fd = None
+                    failed.append((state, chunks))
+                    if error is None:
+                        error = e
+            if failed:
+                self._requeue(failed)
+            if error is not None:
+                raise error
+
+    def _requeue(self, failed: List[Tuple[_LogState, List[bytes]]]) -> None:
+        # 未写出的行放回各自队列的最前面，保持原有顺序
+        with self._lock:
+            for state, chunks in failed:
+                if not state.pending:
+                    self._dirty.append(state)
+                state.pending.extendleft(reversed(chunks))
+                self._pending_count += len(chunks)
+
+    def _flush_loop(self) -> None:
+        me = threading.current_thread()
+        while True:
+            self._wakeup.wait()
+            if self._pending_count <= FLUSH_DEPTH:
+                time.sleep(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            # 在 clear 之后检查：close_all 先撤下线程再 set，两种先后顺序下都不会漏掉退出通知
+            if self._flusher is not me:
+                return
+            try:
+                self.flush()
+            except OSError:
+                # 写日志失败不影响主流程；失败的行已放回队列，下次写盘时重试
+                pass
+
+    def _enqueue(self, items: List[Tuple[_LogState, bytes]]) -> None:
+        with self._lock:
+            for state, line in items:
+                if not state.pending:
+                    self._dirty.append(state)
+                state.pending.append(line)
+            self._pending_count += len(items)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="FileLogger-flush", daemon=True)
+                self._flusher.start()
+        self._wakeup.set()
+
+    def _on_command_many(self, evts: Sequence[CommandEvent]) -> None:
+        # 先格式化整批事件，再一次加锁入队；同一文件的行在 flush 时一次 writev 写出
+        items: List[Tuple[_LogState, bytes]] = []
+        for evt in evts:
+            if not evt.file:
+                continue
+            file = Path(evt.file)
+            state = self.enabled_files.get(file)
+            if state is None:
+                continue
+            if file not in self.session_started:
+                items.append((state, b"session start at " + _ts_bytes(evt.at) + b"\n"))
+                self.session_started.add(file)
+            parts = [_ts_bytes(evt.at), b" ", _cmd_b(evt.command)]
             if evt.args:
-                f.write(f"{_ts()} {evt.command} {evt.args}\n")
-            else:
-                f.write(f"{_ts()} {evt.command}\n")
+                parts.append(b" ")
+                parts.append(evt.args.encode("utf-8", "replace"))
+            parts.append(b"\n")
+            items.append((state, b"".join(parts)))
+        if items:
+            self._enqueue(items)
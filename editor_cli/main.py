@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 import shlex
+import sys
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from .workspace import Workspace
 
 
+# 命令处理函数：返回单行输出、多行输出（列表或逐行产生的迭代器），或 None 表示参数不合法（打印用法）
+Output = Union[str, List[str], Iterator[str], None]
+Handler = Callable[[Workspace, List[str]], Output]
+
+
 def parse_line_col(token: str) -> tuple[int, int]:
     if ":" not in token:
         raise ValueError
@@ -14,8 +20,171 @@ def parse_line_col(token: str) -> tuple[int, int]:
     return int(a), int(b)
 
 
+def _cmd_load(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 1:
+        return ws.load(args[0])
+    return None
+
+
+def _cmd_save(ws: Workspace, args: List[str]) -> Output:
+    if not args:
+        return ws.save()
+    if len(args) == 1:
+        return ws.save(args[0])
+    return None
+
+
+def _cmd_init(ws: Workspace, args: List[str]) -> Output:
+    if len(args) >= 1:
+        with_log = len(args) >= 2 and args[1] == "with-log"
+        return ws.init(args[0], with_log=with_log)
+    return None
+
+
+def _cmd_close(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 0:
+        return ws.close()
+    if len(args) == 1:
+        return ws.close(args[0])
+    return None
+
+
+def _cmd_edit(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 1:
+        return ws.edit_active(args[0])
+    return None
+
+
+def _cmd_editor_list(ws: Workspace, args: List[str]) -> Output:
+    return ws.editor_list()
+
+
+def _cmd_dir_tree(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 0:
+        return ws.dir_tree()
+    if len(args) == 1:
+        return ws.dir_tree(args[0])
+    return None
+
+
+def _cmd_append(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 1:
+        return ws.append(args[0])
+    return None
+
+
+def _cmd_insert(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 2:
+        return ws.insert(parse_line_col(args[0]), args[1])
+    return None
+
+
+def _cmd_delete(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 2:
+        return ws.delete(parse_line_col(args[0]), int(args[1]))
+    return None
+
+
+def _cmd_replace(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 3:
+        return ws.replace(parse_line_col(args[0]), int(args[1]), args[2])
+    return None
+
+
+def _cmd_show(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 0:
+        text = ws.show_joined()
+    elif len(args) == 1 and ":" in args[0]:
+        a, b = args[0].split(":", 1)
+        text = ws.show_joined(int(a), int(b))
+    else:
+        return None
+    return [text] if text else []
+
+
+def _cmd_undo(ws: Workspace, args: List[str]) -> Output:
+    return ws.undo()
+
+
+def _cmd_redo(ws: Workspace, args: List[str]) -> Output:
+    return ws.redo()
+
+
+def _cmd_log_on(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 0:
+        return ws.log_on()
+    if len(args) == 1:
+        return ws.log_on(args[0])
+    return None
+
+
+def _cmd_log_off(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 0:
+        return ws.log_off()
+    if len(args) == 1:
+        return ws.log_off(args[0])
+    return None
+
+
+def _cmd_log_show(ws: Workspace, args: List[str]) -> Output:
+    if len(args) == 0:
+        return ws.log_show()
+    if len(args) == 1:
+        return ws.log_show(args[0])
+    return None
+
+
+# 命令分发表：命令名 -> (处理函数, 用法)
+COMMANDS: Dict[str, Tuple[Handler, str]] = {
+    "load": (_cmd_load, "用法: load <file>"),
+    "save": (_cmd_save, "用法: save [file|all]"),
+    "init": (_cmd_init, "用法: init <file> [with-log]"),
+    "close": (_cmd_close, "用法: close [file]"),
+    "edit": (_cmd_edit, "用法: edit <file>"),
+    "editor-list": (_cmd_editor_list, "用法: editor-list"),
+    "dir-tree": (_cmd_dir_tree, "用法: dir-tree [path]"),
+    "append": (_cmd_append, "用法: append \"text\""),
+    "insert": (_cmd_insert, "用法: insert <line:col> \"text\""),
+    "delete": (_cmd_delete, "用法: delete <line:col> <len>"),
+    "replace": (_cmd_replace, "用法: replace <line:col> <len> \"text\""),
+    "show": (_cmd_show, "用法: show [startLine:endLine]"),
+    "undo": (_cmd_undo, "用法: undo"),
+    "redo": (_cmd_redo, "用法: redo"),
+    "log-on": (_cmd_log_on, "用法: log-on [file]"),
+    "log-off": (_cmd_log_off, "用法: log-off [file]"),
+    "log-show": (_cmd_log_show, "用法: log-show [file]"),
+}
+
+
+def _split_command(line: str) -> Optional[List[str]]:
+    # 纯 ASCII 且无引号、无转义时直接按空白切分，避免逐字符的 shlex 解析
+    # （非 ASCII 行交给 shlex，以免全角空格等被 str.split 当作分隔符）
+    if line.isascii() and '"' not in line and "'" not in line and "\\" not in line:
+        return line.split()
+    try:
+        return shlex.split(line)
+    except ValueError as e:
+        print(f"参数解析错误: {e}")
+        return None
+
+
+def _exit(ws: Workspace) -> None:
+    # 退出前提示所有未保存文件
+    for key, ed in list(ws.editors.items()):
+        if ed.modified:
+            ans = input(f"{ed.path.name} 已修改，是否保存? (y/n) ").strip().lower()
+            if ans == "y":
+                ed.save()
+                ws._emit("save", file=key)
+    ws.persist()
+    print("已退出。")
+
+
 def run_repl(root: Path) -> None:
     ws = Workspace.create(root)
+    if not sys.stdin.isatty():
+        # 脚本输入时批量分发命令事件
+        ws.buffer_events()
     print("简易文本编辑器（Lab1）。输入命令，输入 'exit' 退出。")
     try:
         while True:
@@ -25,133 +194,61 @@ def run_repl(root: Path) -> None:
                 line = "exit"
             if not line:
                 continue
-            try:
-                tokens = shlex.split(line)
-            except ValueError as e:
-                print(f"参数解析错误: {e}")
+            tokens = _split_command(line)
+            if tokens is None:
                 continue
             cmd = tokens[0]
             args = tokens[1:]
 
-            out: Optional[str] = None
-            out_lines: Optional[list[str]] = None
-
-            try:
-                if cmd == "load" and len(args) == 1:
-                    out = ws.load(args[0])
-                elif cmd == "save":
-                    if not args:
-                        out = ws.save()
-                    elif len(args) == 1:
-                        out = ws.save(args[0])
-                    else:
-                        out = "用法: save [file|all]"
-                elif cmd == "init":
-                    if len(args) >= 1:
-                        with_log = len(args) >= 2 and args[1] == "with-log"
-                        out = ws.init(args[0], with_log=with_log)
-                    else:
-                        out = "用法: init <file> [with-log]"
-                elif cmd == "close":
-                    if len(args) == 0:
-                        out = ws.close()
-                    elif len(args) == 1:
-                        out = ws.close(args[0])
-                    else:
-                        out = "用法: close [file]"
-                elif cmd == "edit" and len(args) == 1:
-                    out = ws.edit_active(args[0])
-                elif cmd == "editor-list":
-                    out_lines = ws.editor_list()
-                elif cmd == "dir-tree":
-                    if len(args) == 0:
-                        out_lines = ws.dir_tree()
-                    elif len(args) == 1:
-                        out_lines = ws.dir_tree(args[0])
-                    else:
-                        out = "用法: dir-tree [path]"
-                elif cmd == "append" and len(args) == 1:
-                    out = ws.append(args[0])
-                elif cmd == "insert":
-                    if len(args) == 2:
-                        line_col = parse_line_col(args[0])
-                        out = ws.insert(line_col, args[1])
-                    else:
-                        out = "用法: insert <line:col> \"text\""
-                elif cmd == "delete":
-                    if len(args) == 2:
-                        line_col = parse_line_col(args[0])
-                        length = int(args[1])
-                        out = ws.delete(line_col, length)
-                    else:
-                        out = "用法: delete <line:col> <len>"
-                elif cmd == "replace":
-                    if len(args) == 3:
-                        line_col = parse_line_col(args[0])
-                        length = int(args[1])
-                        out = ws.replace(line_col, length, args[2])
-                    else:
-                        out = "用法: replace <line:col> <len> \"text\""
-                elif cmd == "show":
-                    if len(args) == 0:
-                        out_lines = ws.show()
-                    elif len(args) == 1 and ":" in args[0]:
-                        a, b = args[0].split(":", 1)
-                        out_lines = ws.show(int(a), int(b))
-                    else:
-                        out = "用法: show [startLine:endLine]"
-                elif cmd == "undo":
-                    out = ws.undo()
-                elif cmd == "redo":
-                    out = ws.redo()
-                elif cmd == "log-on":
-                    if len(args) == 0:
-                        out = ws.log_on()
-                    elif len(args) == 1:
-                        out = ws.log_on(args[0])
-                    else:
-                        out = "用法: log-on [file]"
-                elif cmd == "log-off":
-                    if len(args) == 0:
-                        out = ws.log_off()
-                    elif len(args) == 1:
-                        out = ws.log_off(args[0])
-                    else:
-                        out = "用法: log-off [file]"
-                elif cmd == "log-show":
-                    if len(args) == 0:
-                        out_lines = ws.log_show()
-                    elif len(args) == 1:
-                        out_lines = ws.log_show(args[0])
-                    else:
-                        out = "用法: log-show [file]"
-                elif cmd == "exit":
-                    # 退出前提示所有未保存文件
-                    for p, ed in list(ws.editors.items()):
-                        if ed.modified:
-                            ans = input(f"{p.name} 已修改，是否保存? (y/n) ").strip().lower()
-                            if ans == "y":
-                                ed.save()
-                                ws._emit("save", file=p)
-                    ws.persist()
-                    print("已退出。")
+            if cmd == "exit":
+                try:
+                    _exit(ws)
                     break
-                else:
-                    out = f"未知命令: {cmd}"
-            except Exception as e:
-                out = f"错误: {e}"
-
-            if out_lines is not None:
-                for l in out_lines:
-                    print(l)
-            elif out is not None:
+                except Exception as e:
+                    print(f"错误: {e}")
+                    continue
+
+            out: Output
+            entry = COMMANDS.get(cmd)
+            if entry is None:
+                out = f"未知命令: {cmd}"
+            else:
+                handler, usage = entry
+                try:
+                    out = handler(ws, args)
+                    if out is None:
+                        out = usage
+                except Exception as e:
+                    out = f"错误: {e}"
+
+            if isinstance(out, list):
+                # 多行输出一次性写出
+                if out:
+                    sys.stdout.write("\n".join(out))
+                    sys.stdout.write("\n")
+            elif isinstance(out, str):
                 print(out)
+            else:
+                # 迭代器（如日志）边读边写，不整体读入内存；读取时的错误同样按命令错误输出
+                write = sys.stdout.write
+                try:
+                    for ln in out:
+                        write(ln)
+                        write("\n")
+                except Exception as e:
+                    print(f"错误: {e}")
     finally:
         # 兜底持久化
         try:
             ws.persist()
         except Exception:
             pass
+        ws.flush_events()
+        try:
+            ws.file_logger.flush()
+        except OSError:
+            # 写日志失败不影响退出；未写出的行留在队列中，退出时 close_all 再尝试一次
+            pass
 
 
 def main() -> None:
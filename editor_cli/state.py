@@ -1,16 +1,30 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from pathlib import Path
 import json
 from typing import Dict, List, Optional
 
+try:  # 可选依赖：C 实现的 JSON 编解码，缺失时退回标准库
+    import orjson
+except ImportError:
+    orjson = None
+
 
 @dataclass
 class EditorState:
     path: str
-    modified: bool
-    logging_enabled: bool
+    modified: bool = False
+    logging_enabled: bool = False
+
+    def to_dict(self) -> Dict[str, object]:
+        # 只写出与默认值不同的字段，读取时缺省字段取默认值
+        data: Dict[str, object] = {"path": self.path}
+        if self.modified:
+            data["modified"] = True
+        if self.logging_enabled:
+            data["logging_enabled"] = True
+        return data
 
 
 @dataclass
@@ -18,20 +32,27 @@ class WorkspaceMemento:
     open_files: List[EditorState]
     active_file: Optional[str]
 
-    def to_json(self) -> str:
-        return json.dumps(asdict(self), ensure_ascii=False, indent=2)
+    def to_json(self, human: bool = False) -> bytes:
+        # 默认输出紧凑格式；human=True 时缩进，便于人工查看
+        data = {"open_files": [es.to_dict() for es in self.open_files], "active_file": self.active_file}
+        if orjson is not None:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if human else 0)
+        if human:
+            return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
     @staticmethod
     def from_file(path: Path) -> Optional[WorkspaceMemento]:
         if not path.exists():
             return None
         try:
-            data = json.loads(path.read_text(encoding="utf-8"))
+            raw = path.read_bytes()
+            data = orjson.loads(raw) if orjson is not None else json.loads(raw)
             open_files = [EditorState(**e) for e in data.get("open_files", [])]
             active = data.get("active_file")
             return WorkspaceMemento(open_files=open_files, active_file=active)
         except Exception:
             return None
 
-    def save(self, path: Path) -> None:
-        path.write_text(self.to_json(), encoding="utf-8")
+    def save(self, path: Path, human: bool = False) -> None:
+        path.write_bytes(self.to_json(human))
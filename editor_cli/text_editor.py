@@ -1,48 +1,112 @@
 from __future__ import annotations
 
+import os
+import secrets
+import shutil
+import time
+from collections import deque
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional
+from typing import Deque, List, Optional, Tuple
 
-from .commands import TextInsertCommand, TextDeleteCommand, TextReplaceCommand, Command
+from .commands import TextInsertCommand, TextDeleteCommand, TextReplaceCommand, CompositeCommand, Command
+
+
+# 撤销栈最多保留的记录数
+UNDO_LIMIT = 1000
+# 连续插入合并为一条撤销记录的时间窗口（秒）
+MERGE_WINDOW = 0.5
 
 
 class TextEditorError(Exception):
     pass
 
 
-@dataclass
+# 判断首行 # log 时最多读取的字节数
+_HEADER_LIMIT = 4096
+
+
+def _read_lines(path: Path) -> List[str]:
+    # 延迟加载时读入全文：文件已被删除或无法解码时报错，不能当作空文件（否则保存会清空原文件）
+    try:
+        content = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        raise TextEditorError(f"文件已不存在: {path}") from None
+    except UnicodeDecodeError as e:
+        raise TextEditorError(f"无法按 UTF-8 解码: {path}") from e
+    # 保持行结构，末尾换行不强制
+    return content.split("\n")
+
+
+def _open_tmp(target: Path) -> Tuple[int, Path]:
+    # 在目标所在目录独占创建唯一的临时文件；权限按普通新建文件（0666 减去 umask）由内核决定
+    while True:
+        tmp = target.with_name(f".{target.name}.{secrets.token_hex(4)}.tmp")
+        try:
+            return os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_CLOEXEC", 0), 0o666), tmp
+        except FileExistsError:
+            continue
+
+
+@dataclass(slots=True)
 class TextEditor:
     path: Path
-    lines: List[str] = field(default_factory=list)
+    # 为 None 时表示内容尚未读入，首次访问 lines 时再从磁盘加载
+    _lines: Optional[List[str]] = None
     modified: bool = False
     logging_enabled: bool = False
-    _undo_stack: List[Command] = field(default_factory=list)
+    # 撤销栈有上限，超出时自动丢弃最早的记录；重做栈只接收撤销弹出的记录，不会超过该上限
+    undo_limit: int = UNDO_LIMIT
+    _undo_stack: Deque[Command] = field(default_factory=lambda: deque(maxlen=UNDO_LIMIT))
     _redo_stack: List[Command] = field(default_factory=list)
+    # 最近一次入栈的时间，用于合并连续插入
+    _last_push_at: float = 0.0
+    # 非 None 时新命令先收集在这里，end_group 时合并为一条撤销记录
+    _group: Optional[List[Command]] = None
+
+    def __post_init__(self) -> None:
+        if self._undo_stack.maxlen != self.undo_limit:
+            self._undo_stack = deque(self._undo_stack, maxlen=self.undo_limit)
+
+    @property
+    def lines(self) -> List[str]:
+        if self._lines is None:
+            self._lines = _read_lines(self.path)
+        return self._lines
+
+    @lines.setter
+    def lines(self, value: List[str]) -> None:
+        self._lines = value
 
     @staticmethod
     def from_file(path: Path) -> "TextEditor":
-        if path.exists():
-            content = path.read_text(encoding="utf-8")
-            # 保持行结构，末尾换行不强制
-            lines = content.split("\n")
-        else:
-            lines = []
-        editor = TextEditor(path=path, lines=lines, modified=not path.exists())
-        # 自动日志开关：首行 # log
-        if lines and lines[0].strip() == "# log":
+        # 只读取首行判断日志开关，全文在首次访问 lines 时才加载；
+        # 直接打开而不先 exists()，文件不存在时由异常得知，省去一次 stat
+        try:
+            f = path.open("rb")
+        except FileNotFoundError:
+            return TextEditor(path=path, _lines=[], modified=True)
+        with f:
+            first = f.readline(_HEADER_LIMIT)
+        editor = TextEditor(path=path)
+        # 自动日志开关：首行 # log；先在字节上做包含检查，绝大多数文件无需解码首行
+        if b"# log" in first and first.decode("utf-8", "replace").strip() == "# log":
             editor.logging_enabled = True
         return editor
 
     @staticmethod
     def init_new(path: Path, with_log: bool = False) -> "TextEditor":
         lines: List[str] = ["# log"] if with_log else []
-        editor = TextEditor(path=path, lines=lines, modified=True)
+        editor = TextEditor(path=path, _lines=lines, modified=True)
         if with_log:
             editor.logging_enabled = True
         return editor
 
     def _ensure_position(self, line: int, col: int) -> None:
+        lines = self.lines
+        # 常见情况：位置合法，一次链式比较后直接返回；非法时再逐项判断给出对应错误
+        if 0 < line <= len(lines) and 0 < col <= len(lines[line - 1]) + 1:
+            return
         if line < 1 or (len(self.lines) == 0 and (line != 1 or col != 1)):
             raise TextEditorError("空文件只能在1:1位置插入")
         if line > len(self.lines):
@@ -55,33 +119,97 @@ class TextEditor:
 
     def _push_command(self, cmd: Command) -> None:
         cmd.execute()
-        self._undo_stack.append(cmd)
-        self._redo_stack.clear()
+        now = time.monotonic()
+        # 短时间内连续的相邻插入合并为一条撤销记录
+        pending = self._group if self._group is not None else self._undo_stack
+        top = pending[-1] if pending else None
+        merged = (
+            isinstance(top, TextInsertCommand)
+            and now - self._last_push_at < MERGE_WINDOW
+            and top.try_merge(cmd)
+        )
+        self._last_push_at = now
+        if merged:
+            # 能合并说明上次入栈后没有撤销/重做（二者都会重置 _last_push_at），重做栈必为空
+            self.modified = True
+        else:
+            self._record(cmd)
+
+    def _record(self, cmd: Command) -> None:
+        # 已执行的命令入撤销栈（编组中则先收集），并清空重做栈
+        if self._group is not None:
+            self._group.append(cmd)
+        else:
+            self._undo_stack.append(cmd)
+        # 常见情况下重做栈本就为空，省去一次 clear 调用
+        if self._redo_stack:
+            self._redo_stack.clear()
         self.modified = True
 
+    def execute_many(self, cmds: List[Command]) -> None:
+        """依次执行一组命令并作为一条撤销记录入栈，清空重做栈等簿记只做一次。
+
+        某条命令执行失败时先撤销已执行的命令，再抛出异常。
+        """
+        if not cmds:
+            return
+        done: List[Command] = []
+        try:
+            for cmd in cmds:
+                cmd.execute()
+                done.append(cmd)
+        except BaseException:
+            for cmd in reversed(done):
+                cmd.undo()
+            raise
+        self._record(done[0] if len(done) == 1 else CompositeCommand(done))
+        # 批量记录自成一条，之后的插入不与它或更早的命令合并
+        self._last_push_at = 0.0
+
+    def begin_group(self) -> None:
+        """开始编组：之后的编辑在 end_group 时合并为一条撤销记录。"""
+        if self._group is None:
+            self._group = []
+
+    def end_group(self) -> None:
+        self._seal_group()
+        self._group = None
+
+    def _seal_group(self) -> None:
+        # 把已收集的命令作为一条记录压入撤销栈，编组保持打开
+        group = self._group
+        if group:
+            self._undo_stack.append(group[0] if len(group) == 1 else CompositeCommand(group))
+            self._group = []
+
+    def _splice_lines(self, line: int, col: int, length: int, text: str) -> None:
+        # 用多行文本替换 line:col 起长度为 length 的范围，撤销记录只保存变化的行
+        idx = line - 1
+        pos = col - 1
+        original = self.lines[idx]
+        after = original[pos + length :]
+        # 直接在 split 得到的列表上拼接首末两段，不再构造中间列表
+        new_lines = text.split("\n")
+        new_lines[0] = original[:pos] + new_lines[0]
+        if new_lines[-1] or after:
+            new_lines[-1] += after
+        else:
+            new_lines.pop()
+        change = _DeltaChange(self.lines, line_index=idx, removed_lines=[original], inserted_lines=new_lines)
+        change.execute()
+        self._record(change)
+
     def append(self, text: str) -> None:
-        # 追加一行
-        self.lines.append(text)
-        self.modified = True
-        self._redo_stack.clear()
-        # 作为不可撤销的简单操作不进入undo栈（更简单也可进入，但这里保持一致性：将其作为单行插入到末行）
-        # 将append转化为对末行的插入以支持undo/redo
-        if len(self.lines) >= 1:
-            # 模拟成对新行的插入：构造插入命令在新的末行基础上
-            # 先撤回上面的append直接修改，将真正的插入交给命令，以便undo
-            new_line_index = len(self.lines)
-            self.lines.pop()  # 回退
-            if new_line_index == 1:
-                # 空 -> 第一行
-                self.lines.append("")
-            else:
-                self.lines.append("")
-            self.insert((new_line_index, 1), text)
+        # 追加一行：先加一个空行，再把文本作为对该行的插入命令执行，以支持undo/redo
+        self.lines.append("")
+        line = len(self.lines)
+        if "\n" in text:
+            self.insert((line, 1), text)
+        else:
+            self._push_command(TextInsertCommand(self.lines, line, 1, text))
 
     def insert(self, pos: tuple[int, int], text: str) -> None:
         line, col = pos
-        # 支持多行插入（拆分为多步）
-        parts = text.split("\n")
         if not self.lines:
             # 空文件，只允许1:1
             if not (line == 1 and col == 1):
@@ -90,36 +218,12 @@ class TextEditor:
 
         self._ensure_position(line, col)
 
-        if len(parts) == 1:
-            cmd = TextInsertCommand(self.lines, line, col, parts[0])
+        if "\n" not in text:
+            cmd = TextInsertCommand(self.lines, line, col, text)
             self._push_command(cmd)
         else:
-            # 多行：先在第一行插入第一段，再在同一行col后断开并插入中间行与最后一段
-            # 采取简单实现：在当前位置插入整段，然后替换为分行拼接
-            # 更直接的实现：手工重构目标行
-            idx = line - 1
-            pos = col - 1
-            before = self.lines[idx][:pos]
-            after = self.lines[idx][pos:]
-            new_lines = [before + parts[0]] + parts[1:-1] + [parts[-1] + after]
-            # 用替换命令序列实现（保存undo为整体替换）
-            original = self.lines[idx]
-            # 先将目标行变为第一段
-            cmd1 = TextReplaceCommand(self.lines, line, col, len(original) - pos, parts[0])
-            cmd1.execute()
-            # 在下一行插入中间行
-            insert_pos = idx + 1
-            for mid in parts[1:-1]:
-                self.lines.insert(insert_pos, mid)
-                insert_pos += 1
-            # 最后一行将剩余拼接
-            if parts[-1] or after:
-                self.lines.insert(insert_pos, parts[-1] + after)
-            self._undo_stack.append(
-                _CompositeLineChange(self.lines, line_index=idx, prev_line=original, prev_after_lines_count=len(parts) - 1)
-            )
-            self._redo_stack.clear()
-            self.modified = True
+            # 多行：目标行在 col 处断开，首段接在前半部分后，末段接上后半部分
+            self._splice_lines(line, col, 0, text)
 
     def delete(self, pos: tuple[int, int], length: int) -> None:
         line, col = pos
@@ -144,19 +248,9 @@ class TextEditor:
         leftover = len(self.lines[idx]) - pos0
         if length > leftover:
             raise TextEditorError("删除长度超出行尾")
-        # 支持多行替换：将等效为删除+插入（可能引入新行）
+        # 支持多行替换：被替换的范围换成多行文本（可能引入新行）
         if "\n" in text:
-            # 先删除该范围，再在删除起点插入多行
-            prev_line = self.lines[idx]
-            del_cmd = TextDeleteCommand(self.lines, line, col, length)
-            del_cmd.execute()
-            # 插入多行，采用insert的多行逻辑
-            # 但需要一个复合undo
-            after_delete_state = list(self.lines)
-            self.insert((line, col), text)
-            self._undo_stack.append(
-                _CompositeReplaceChange(self.lines, line_index=idx, prev_line=prev_line, after_delete_snapshot=after_delete_state)
-            )
+            self._splice_lines(line, col, length, text)
         else:
             cmd = TextReplaceCommand(self.lines, line, col, length, text)
             self._push_command(cmd)
@@ -168,68 +262,77 @@ class TextEditor:
         e = len(self.lines) if end is None else min(len(self.lines), end)
         if s > e:
             return []
-        return [f"{i}: {self.lines[i-1]}" for i in range(s, e + 1)]
+        # 行号与行内容成对取出，% 格式化免去 f-string 的格式说明解析
+        return ["%d: %s" % t for t in zip(range(s, e + 1), self.lines[s - 1 : e])]
+
+    def show_joined(self, start: Optional[int] = None, end: Optional[int] = None) -> str:
+        # 供命令行直接输出：一次 join 得到整段文本
+        return "\n".join(self.show(start, end))
 
     def undo(self) -> bool:
+        # 编组中撤销时先把已收集的命令封为一条记录，撤销的是整组
+        self._seal_group()
         if not self._undo_stack:
             return False
         cmd = self._undo_stack.pop()
         cmd.undo()
+        self._last_push_at = 0.0
         self._redo_stack.append(cmd)
         self.modified = True
         return True
 
     def redo(self) -> bool:
+        self._seal_group()
         if not self._redo_stack:
             return False
         cmd = self._redo_stack.pop()
         cmd.execute()
+        self._last_push_at = 0.0
         self._undo_stack.append(cmd)
         self.modified = True
         return True
 
     def save(self) -> None:
-        # 将行用\n连接
-        content = "\n".join(self.lines)
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.path.write_text(content, encoding="utf-8")
+        # 逐行编码写入临时文件（行间用\n连接），写完后原子替换目标文件，
+        # 不在内存中拼出整个文件内容，写到一半失败也不会损坏原文件。
+        # 目标为符号链接时写入其指向的文件；临时文件名唯一，并沿用原文件的权限
+        target = Path(os.path.realpath(self.path))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = _open_tmp(target)
+        try:
+            with open(fd, "wb", buffering=1 << 16) as f:
+                write = f.write
+                it = iter(self.lines)
+                first = next(it, None)
+                if first is not None:
+                    write(first.encode("utf-8"))
+                for ln in it:
+                    write(b"\n")
+                    write(ln.encode("utf-8"))
+            try:
+                shutil.copymode(target, tmp)
+            except FileNotFoundError:
+                # 新文件：保留创建临时文件时的默认权限
+                pass
+            os.replace(tmp, target)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
         self.modified = False
 
 
-class _CompositeLineChange:
-    # 用于多行插入的复合变更撤销
-    def __init__(self, buffer: List[str], line_index: int, prev_line: str, prev_after_lines_count: int) -> None:
-        self.buffer = buffer
-        self.line_index = line_index
-        self.prev_line = prev_line
-        self.prev_after_lines_count = prev_after_lines_count
-
-    def execute(self) -> None:
-        # 复合变更在insert阶段已执行，这里不做
-        pass
-
-    def undo(self) -> None:
-        # 将插入的若干后续行删除，并恢复原始目标行
-        for _ in range(self.prev_after_lines_count):
-            if self.line_index + 1 < len(self.buffer):
-                self.buffer.pop(self.line_index + 1)
-        self.buffer[self.line_index] = self.prev_line
-
-
-class _CompositeReplaceChange:
-    # 用于多行替换的复合变更撤销
-    def __init__(self, buffer: List[str], line_index: int, prev_line: str, after_delete_snapshot: List[str]) -> None:
+class _DeltaChange:
+    # 多行插入/替换的反向补丁：只记录被替换掉的行和写入的行，撤销/重做均为一次切片赋值
+    def __init__(self, buffer: List[str], line_index: int, removed_lines: List[str], inserted_lines: List[str]) -> None:
         self.buffer = buffer
         self.line_index = line_index
-        self.prev_line = prev_line
-        self.after_delete_snapshot = after_delete_snapshot
+        self.removed_lines = removed_lines
+        self.inserted_lines = inserted_lines
 
     def execute(self) -> None:
-        pass
+        i = self.line_index
+        self.buffer[i : i + len(self.removed_lines)] = self.inserted_lines
 
     def undo(self) -> None:
-        # 先回到删除后的状态，再恢复目标行
-        self.buffer.clear()
-        self.buffer.extend(self.after_delete_snapshot)
-        if self.line_index < len(self.buffer):
-            self.buffer[self.line_index] = self.prev_line
+        i = self.line_index
+        self.buffer[i : i + len(self.inserted_lines)] = self.removed_lines
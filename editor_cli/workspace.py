@@ -1,8 +1,12 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Optional, List, Tuple
+from typing import Callable, Dict, Iterator, Optional, List, Tuple
 
 from .events import EventBus, CommandEvent
 from .state import WorkspaceMemento, EditorState
@@ -10,14 +14,63 @@ from .text_editor import TextEditor, TextEditorError
 from .logger import FileLogger
 
 
+# 缓存模式下累积多少条命令事件后批量分发
+EVENT_BATCH = 64
+# save all 时并行写盘的线程数上限
+SAVE_WORKERS = 8
+
+# editor-list 的前缀/后缀，以 bool 为下标取用
+_LIST_PREFIX = ("  ", "* ")
+_LIST_SUFFIX = ("", " [modified]")
+
+
+def _coalesce(events: List[CommandEvent]) -> List[CommandEvent]:
+    # 合并连续的 (文件, 命令) 相同的事件：参数用 "; " 连接，无参数时记为 xN
+    out: List[CommandEvent] = []
+    i, n = 0, len(events)
+    while i < n:
+        first = events[i]
+        j = i + 1
+        while j < n and events[j].command == first.command and events[j].file == first.file:
+            j += 1
+        if j - i == 1:
+            out.append(first)
+        else:
+            args = [e.args for e in events[i:j] if e.args]
+            merged = "; ".join(args) if args else f"x{j - i}"
+            out.append(CommandEvent(file=first.file, command=first.command, args=merged, at=first.at))
+        i = j
+    return out
+
+
 @dataclass
 class Workspace:
     root: Path
     event_bus: EventBus
     file_logger: FileLogger
-    editors: Dict[Path, TextEditor]
-    active: Optional[Path]
+    # 以解析后路径的字符串为键：str 的哈希有缓存，查找比 Path 键更快；
+    # 键均经 sys.intern，active、解析缓存与快照共用同一个字符串对象
+    editors: Dict[str, TextEditor]
+    active: Optional[str]
     state_file: Path
+    # 非 None 时命令事件先缓存，满 EVENT_BATCH 条或 flush_events 时批量分发
+    _pending_events: Optional[List[CommandEvent]] = None
+    # 为 True 时 flush_events 先合并连续的同类事件（见 batched_events）
+    _coalesce_events: bool = False
+    # 原始文件参数 -> 解析后路径的字符串（即 editors 的键），避免每条命令都 resolve（一次 stat/readlink）
+    _resolve_cache: Dict[str, str] = field(default_factory=dict)
+    # begin_batch 与 end_batch 之间各文件的编辑合并为一条撤销记录
+    _batch_active: bool = False
+    # 最近一次 persist 写出的状态文件内容
+    _persisted: Optional[bytes] = None
+
+    def __post_init__(self) -> None:
+        # save 的参数分派表
+        self._save_dispatch: Dict[Optional[str], Callable[[Optional[str]], str]] = {
+            None: self._save_active,
+            "all": self._save_all,
+        }
+        self._rebind_emit()
 
     @staticmethod
     def create(root: Path) -> "Workspace":
@@ -31,10 +84,9 @@ class Workspace:
 
     def _snapshot(self) -> WorkspaceMemento:
         open_files: List[EditorState] = []
-        for p, ed in self.editors.items():
-            open_files.append(EditorState(path=str(p), modified=ed.modified, logging_enabled=ed.logging_enabled))
-        active_file = str(self.active) if self.active else None
-        return WorkspaceMemento(open_files=open_files, active_file=active_file)
+        for key, ed in self.editors.items():
+            open_files.append(EditorState(path=key, modified=ed.modified, logging_enabled=ed.logging_enabled))
+        return WorkspaceMemento(open_files=open_files, active_file=self.active)
 
     def _restore(self) -> None:
         m = WorkspaceMemento.from_file(self.state_file)
@@ -43,115 +95,232 @@ class Workspace:
         # 打开文件并恢复轻量状态
         for es in m.open_files:
             p = Path(es.path)
-            ed = TextEditor.from_file(p)
+            if es.logging_enabled:
+                # 日志开关已记录在状态中，无需打开文件读首行；内容在首次访问时才加载
+                ed = TextEditor(path=p, logging_enabled=True)
+            else:
+                ed = TextEditor.from_file(p)
             ed.modified = es.modified
-            ed.logging_enabled = es.logging_enabled or ed.logging_enabled
             if ed.logging_enabled:
-                self.file_logger.set_enabled(ed.path, True)
-            self.editors[p] = ed
+                self._set_logging(ed.path, True)
+            self.editors[sys.intern(str(p))] = ed
         if m.active_file:
-            ap = Path(m.active_file)
-            if ap in self.editors:
-                self.active = ap
+            ak = sys.intern(str(Path(m.active_file)))
+            if ak in self.editors:
+                self.active = ak
+        self._rebind_emit()
 
     def persist(self) -> None:
-        m = self._snapshot()
-        m.save(self.state_file)
+        # 与上次写出的内容相同时不再重写状态文件
+        data = self._snapshot().to_json()
+        if data == self._persisted:
+            return
+        self.state_file.write_bytes(data)
+        self._persisted = data
 
     # 事件辅助
-    def _emit(self, command: str, args: str = "", file: Optional[Path] = None) -> None:
-        self.event_bus.emit("command", CommandEvent(file=str(file) if file else (str(self.active) if self.active else None), command=command, args=args))
+    def _emit(self, command: str, args: str = "", file: Optional[str] = None) -> None:
+        evt = CommandEvent(file=file or self.active, command=command, args=args)
+        pending = self._pending_events
+        if pending is None:
+            self.event_bus.emit("command", evt)
+            return
+        pending.append(evt)
+        if len(pending) >= EVENT_BATCH:
+            self.flush_events()
+
+    def _emit_noop(self, command: str, args: str = "", file: Optional[str] = None) -> None:
+        pass
+
+    def _rebind_emit(self) -> None:
+        # 命令事件只有日志监听：没有文件开启日志时把 _emit 换成空操作，省去构造事件；
+        # 日志开关、打开或关闭文件后重新绑定
+        if any(ed.logging_enabled for ed in self.editors.values()):
+            self.__dict__.pop("_emit", None)
+        else:
+            self._emit = self._emit_noop
+
+    def buffer_events(self) -> None:
+        """开始缓存命令事件（脚本批量输入时使用），之后需调用 flush_events。"""
+        if self._pending_events is None:
+            self._pending_events = []
+
+    def flush_events(self) -> None:
+        pending = self._pending_events
+        if pending:
+            # 原地清空：batched_events 退出时会恢复外层的列表，不能让它还留着已分发的事件
+            batch = pending[:]
+            pending.clear()
+            if self._coalesce_events:
+                batch = _coalesce(batch)
+            self.event_bus.emit_many("command", batch)
+
+    @contextmanager
+    def batched_events(self) -> Iterator[None]:
+        """在 with 块内缓存命令事件，退出时把同一文件上连续的同名命令合并为一条再分发。"""
+        prev_pending, prev_coalesce = self._pending_events, self._coalesce_events
+        self.flush_events()
+        self._pending_events = []
+        self._coalesce_events = True
+        try:
+            yield
+        finally:
+            self.flush_events()
+            self._pending_events = prev_pending
+            self._coalesce_events = prev_coalesce
+
+    def begin_batch(self) -> None:
+        """开始批量编辑：到 end_batch 为止，每个文件上的编辑只留一条撤销记录。"""
+        self._batch_active = True
+        for ed in self.editors.values():
+            ed.begin_group()
+
+    def end_batch(self) -> None:
+        self._batch_active = False
+        for ed in self.editors.values():
+            ed.end_group()
+
+    def _set_logging(self, p: Path, enabled: bool) -> None:
+        # 先分发缓存的事件，保证日志开关前后的命令按原有状态记录
+        self.flush_events()
+        try:
+            self.file_logger.set_enabled(p, enabled)
+        except OSError:
+            # 写日志失败不影响命令本身；未写出的行留在队列中等待重试
+            pass
 
     # 工作区命令
     def load(self, file: str) -> str:
-        p = (self.root / file).resolve() if not Path(file).is_absolute() else Path(file)
+        key = self._resolve_in_workspace(file)
+        p = Path(key)
         ed = TextEditor.from_file(p)
-        self.editors[p] = ed
-        self.active = p
+        if self._batch_active:
+            ed.begin_group()
+        self.editors[key] = ed
+        self.active = key
         if ed.logging_enabled:
-            self.file_logger.set_enabled(p, True)
-        self._emit("load", p.name, p)
+            self._set_logging(p, True)
+        self._rebind_emit()
+        self._emit("load", p.name, key)
         return f"已加载: {p}"
 
     def save(self, target: Optional[str] = None) -> str:
-        if target is None:
-            if not self.active:
-                return "无活动文件"
-            self.editors[self.active].save()
-            self._emit("save", file=self.active)
-            return f"已保存: {self.active}"
-        if target == "all":
-            for p, ed in self.editors.items():
+        # None / "all" 直接查表，其余按文件路径处理
+        return self._save_dispatch.get(target, self._save_one)(target)
+
+    def _save_active(self, target: None) -> str:
+        if not self.active:
+            return "无活动文件"
+        self.editors[self.active].save()
+        self._emit("save", file=self.active)
+        return f"已保存: {self.active}"
+
+    def _save_all(self, target: str) -> str:
+        items = list(self.editors.items())
+        if len(items) <= 1:
+            for key, ed in items:
                 ed.save()
-                self._emit("save", file=p)
+                self._emit("save", file=key)
             return "已保存所有文件"
-        # 可能是具体文件路径
-        p = self._resolve_in_workspace(target)
-        if p not in self.editors:
+        # 各文件的写盘互不依赖，放到线程池中并行；事件在全部完成后按打开顺序发出
+        with ThreadPoolExecutor(max_workers=min(SAVE_WORKERS, len(items))) as pool:
+            futures = [pool.submit(ed.save) for _, ed in items]
+        error: Optional[BaseException] = None
+        for (key, _), fut in zip(items, futures):
+            exc = fut.exception()
+            if exc is None:
+                self._emit("save", file=key)
+            elif error is None:
+                error = exc
+        if error is not None:
+            raise error
+        return "已保存所有文件"
+
+    def _save_one(self, target: str) -> str:
+        key = self._resolve_in_workspace(target)
+        if key not in self.editors:
             return f"文件未打开: {target}"
-        self.editors[p].save()
-        self._emit("save", file=p)
-        return f"已保存: {p}"
+        self.editors[key].save()
+        self._emit("save", file=key)
+        return f"已保存: {key}"
 
     def init(self, file: str, with_log: bool = False) -> str:
-        p = (self.root / file).resolve() if not Path(file).is_absolute() else Path(file)
+        key = self._resolve_in_workspace(file)
+        p = Path(key)
         ed = TextEditor.init_new(p, with_log=with_log)
-        self.editors[p] = ed
-        self.active = p
+        if self._batch_active:
+            ed.begin_group()
+        self.editors[key] = ed
+        self.active = key
         if ed.logging_enabled:
-            self.file_logger.set_enabled(p, True)
-        self._emit("init", f"{p.name}{' with-log' if with_log else ''}", p)
+            self._set_logging(p, True)
+        self._rebind_emit()
+        self._emit("init", f"{p.name}{' with-log' if with_log else ''}", key)
         return f"已创建缓冲区: {p}"
 
     def close(self, target: Optional[str] = None, prompt_fn=input) -> str:
         if target is None:
             if not self.active:
                 return "无活动文件"
-            p = self.active
+            key = self.active
         else:
-            p = self._resolve_in_workspace(target)
-            if p not in self.editors:
+            key = self._resolve_in_workspace(target)
+            if key not in self.editors:
                 return f"文件未打开: {target}"
-        ed = self.editors[p]
+        ed = self.editors[key]
         if ed.modified:
             ans = prompt_fn("文件已修改，是否保存? (y/n) ").strip().lower()
             if ans == "y":
                 ed.save()
-                self._emit("save", file=p)
-        del self.editors[p]
-        if self.active == p:
+                self._emit("save", file=key)
+        del self.editors[key]
+        if self.active == key:
             self.active = next(iter(self.editors.keys()), None)
-        self._emit("close", file=p)
-        return f"已关闭: {p}"
+        self._emit("close", file=key)
+        self.flush_events()
+        self._forget_resolved(key)
+        self._rebind_emit()
+        try:
+            self.file_logger.close(ed.path)
+        except OSError:
+            # 与其他日志写入一样尽力而为，不让日志错误中断关闭
+            pass
+        return f"已关闭: {key}"
 
     def edit_active(self, file: str) -> str:
-        p = self._resolve_in_workspace(file)
-        if p not in self.editors:
+        key = self._resolve_in_workspace(file)
+        if key not in self.editors:
             return f"文件未打开: {file}"
-        self.active = p
-        return f"当前活动文件: {p}"
+        self.active = key
+        return f"当前活动文件: {key}"
 
     def editor_list(self) -> List[str]:
-        lines: List[str] = []
-        for p, ed in self.editors.items():
-            prefix = "* " if self.active == p else "  "
-            suf = " [modified]" if ed.modified else ""
-            lines.append(f"{prefix}{p.name}{suf}")
-        return lines
+        active = self.active
+        return ["%s%s%s" % (_LIST_PREFIX[key == active], ed.path.name, _LIST_SUFFIX[ed.modified])
+                for key, ed in self.editors.items()]
 
     def dir_tree(self, path: Optional[str] = None) -> List[str]:
         base = (self.root / path).resolve() if path else self.root
         lines: List[str] = []
-        def walk(dir_path: Path, prefix: str = "") -> None:
-            items = sorted(dir_path.iterdir(), key=lambda x: (x.is_file(), x.name.lower()))
-            for i, item in enumerate(items):
-                is_last = i == len(items) - 1
-                connector = "└──" if is_last else "├──"
-                lines.append(f"{prefix}{connector} {item.name}")
-                if item.is_dir():
-                    new_prefix = prefix + ("    " if is_last else "│   ")
-                    walk(item, new_prefix)
-        walk(base)
+        # 显式栈代替递归：栈中为待输出的 (目录项, 前缀, 是否最后一项)，
+        # 子项逆序入栈以保持先序输出；scandir 的目录项缓存了类型信息，无需逐项 stat。
+        # 不跟随符号链接：链接不展开（也避免链接成环），按文件排序
+        stack: List[Tuple[os.DirEntry, str, bool]] = []
+
+        def push_children(dir_path: str, prefix: str) -> None:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda e: (not e.is_dir(follow_symlinks=False), e.name.lower()))
+            last = len(entries) - 1
+            for i in range(last, -1, -1):
+                stack.append((entries[i], prefix, i == last))
+
+        push_children(str(base), "")
+        while stack:
+            entry, prefix, is_last = stack.pop()
+            connector = "└──" if is_last else "├──"
+            lines.append(f"{prefix}{connector} {entry.name}")
+            if entry.is_dir(follow_symlinks=False):
+                push_children(entry.path, prefix + ("    " if is_last else "│   "))
         return lines
 
     # 文本编辑命令
@@ -207,6 +376,12 @@ class Workspace:
             return []
         return ed.show(start, end)
 
+    def show_joined(self, start: Optional[int] = None, end: Optional[int] = None) -> str:
+        ed = self._current_editor()
+        if not ed:
+            return ""
+        return ed.show_joined(start, end)
+
     def undo(self) -> str:
         ed = self._current_editor()
         if not ed:
@@ -229,36 +404,47 @@ class Workspace:
 
     # 日志命令
     def log_on(self, file: Optional[str] = None) -> str:
-        p = self._resolve_for_log(file)
-        if not p:
+        key = self._resolve_for_log(file)
+        if not key:
             return "无活动文件"
-        ed = self.editors[p]
+        ed = self.editors[key]
         ed.logging_enabled = True
-        self.file_logger.set_enabled(p, True)
-        return f"已启用日志: {p.name}"
+        self._set_logging(ed.path, True)
+        self._rebind_emit()
+        return f"已启用日志: {ed.path.name}"
 
     def log_off(self, file: Optional[str] = None) -> str:
-        p = self._resolve_for_log(file)
-        if not p:
+        key = self._resolve_for_log(file)
+        if not key:
             return "无活动文件"
-        ed = self.editors[p]
+        ed = self.editors[key]
         ed.logging_enabled = False
-        self.file_logger.set_enabled(p, False)
-        return f"已关闭日志: {p.name}"
+        self._set_logging(ed.path, False)
+        self._rebind_emit()
+        return f"已关闭日志: {ed.path.name}"
 
-    def log_show(self, file: Optional[str] = None) -> List[str]:
-        p = self._resolve_for_log(file)
-        if not p:
-            return []
-        content = self.file_logger.show(p)
-        return content.splitlines()
+    def log_show(self, file: Optional[str] = None) -> Iterator[str]:
+        # 返回逐行读取的迭代器；调用时即写出缓存的事件，之后的读取不受影响
+        key = self._resolve_for_log(file)
+        if not key:
+            return iter(())
+        self.flush_events()
+        return self.file_logger.iter_lines(self.editors[key].path)
 
     # 帮助方法
-    def _resolve_in_workspace(self, file: str) -> Path:
-        return (self.root / file).resolve() if not Path(file).is_absolute() else Path(file)
+    def _resolve_in_workspace(self, file: str) -> str:
+        key = self._resolve_cache.get(file)
+        if key is None:
+            key = sys.intern(str((self.root / file).resolve() if not Path(file).is_absolute() else Path(file)))
+            self._resolve_cache[file] = key
+        return key
+
+    def _forget_resolved(self, key: str) -> None:
+        for raw in [k for k, v in self._resolve_cache.items() if v == key]:
+            del self._resolve_cache[raw]
 
-    def _resolve_for_log(self, file: Optional[str]) -> Optional[Path]:
+    def _resolve_for_log(self, file: Optional[str]) -> Optional[str]:
         if file is None:
             return self.active
-        p = self._resolve_in_workspace(file)
-        return p if p in self.editors else None
+        key = self._resolve_in_workspace(file)
+        return key if key in self.editors else None